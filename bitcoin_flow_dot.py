@@ -5,36 +5,75 @@ Generates DOT language output from Bitcoin transaction vin/vout data
 """
 
 import json
+import re
 import sys
 from collections import defaultdict
-from typing import Dict, List, Set
+from typing import Dict, List, Set, TextIO
+
+try:
+    # Faster JSON parsing when available; accepts the same bytes/str input
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+# txid:abc123 vin:prev_txid:0,prev_txid2:1 vout:addr1:amount1,addr2:amount2
+TEXT_LINE_RE = re.compile(r'txid:(\S+)(?:\s+vin:(\S*))?(?:\s+vout:(\S*))?\s*$')
+TEXT_VIN_ITEM_RE = re.compile(r'([^:,]+):(\d+)')
+TEXT_VOUT_ITEM_RE = re.compile(r'([^:,]*):([^,]+)')
+
+DOT_HEADER = (
+    "digraph bitcoin_flow {\n"
+    "    rankdir=LR;\n"
+    "    graph [fontname=\"monospace\"];\n"
+    "    node [shape=record, fontname=\"monospace\", fontsize=10];\n"
+    "    edge [fontname=\"Arial\", fontsize=8];\n"
+    "\n"
+)
+DOT_FOOTER = "\n}\n"
+
+class TxNode:
+    """Per-transaction data kept for DOT generation"""
+    __slots__ = ('vin_count', 'vout_ports', 'tx_label', 'size', 'fee')
+
+    def __init__(self, vin_count: int, vout_ports: List[str], tx_label: str, size, fee):
+        self.vin_count = vin_count
+        self.vout_ports = vout_ports
+        self.tx_label = tx_label
+        self.size = size
+        self.fee = fee
 
 class BitcoinFlowVisualizer:
     def __init__(self):
         self.transactions = {}
         self.edges = []
         self.addr_map = {}
+        # Converted labels by raw address; addresses often recur across outputs
+        self._addr_cache = {}
         self._load_addr_map_from_file()
 
     def _load_addr_map_from_file(self, filename: str = "addr_map.json"):
         """Load address map from a JSON file if it exists."""
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(filename, 'rb') as f:
+                data = json_loads(f.read())
                 self.addr_map.update(data)
+                self._addr_cache.clear()
                 print(f"Loaded address map from {filename}")
         except FileNotFoundError:
             print(f"Info: '{filename}' not found. Address labels will be shortened if not in default map.")
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             print(f"Error: Could not decode '{filename}': {e}. Address labels will be shortened.")
 
     def convert_address(self, address: str) -> str:
         """Converts a Bitcoin address to a predefined label or a shortened version."""
         if not address: # Handle cases where address might be None or empty
             return "unknown_address"
-        addr = self.addr_map.get(address)
+        addr = self._addr_cache.get(address)
         if addr is None:
-            addr = f"{address[:4]}...{address[-4:]}"
+            addr = self.addr_map.get(address)
+            if addr is None:
+                addr = address[:4] + "..." + address[-4:]
+            self._addr_cache[address] = addr
         return addr
 
     def parse_transaction_file(self, filename: str):
@@ -44,106 +83,123 @@ class BitcoinFlowVisualizer:
         {"txid": "abc123", "vin": [...], "vout": [...]}
         """
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
+            # Read raw bytes; JSON records are decoded by json_loads directly
+            with open(filename, 'rb', buffering=1 << 23) as f:
+                parse_line = None
                 for line in f:
                     line = line.strip()
-                    if not line or line.startswith('#'):
+                    if not line or line.startswith(b'#'):
                         continue
 
-                    try:
-                        # Try parsing as JSON
-                        tx_data = json.loads(line)
-                        self.process_transaction(tx_data)
-                    except json.JSONDecodeError:
-                        # Try parsing as structured text
-                        self.parse_text_format(line)
+                    if parse_line is None:
+                        # Detect the format once from the first data line
+                        if line.startswith(b'{'):
+                            parse_line = self.parse_json_line
+                        else:
+                            parse_line = self.parse_text_line
+                    parse_line(line)
 
         except FileNotFoundError:
             print(f"Error: File '{filename}' not found.")
             sys.exit(1)
 
+    def parse_json_line(self, line: bytes):
+        """Parse a single JSON Lines record"""
+        try:
+            tx_data = json_loads(line)
+        except ValueError as e:
+            print(f"Warning: Skipping invalid JSON line: {e}")
+            return
+        self.process_transaction(tx_data)
+
+    def parse_text_line(self, line: bytes):
+        """Parse a single text format record"""
+        self.parse_text_format(line.decode('utf-8'))
+
     def parse_text_format(self, line: str):
         """
         Parse simple text format:
         txid:abc123 vin:prev_txid:0,prev_txid2:1 vout:addr1:amount1,addr2:amount2
         """
-        parts = line.split(' ')
-        tx_data = {'vin': [], 'vout': []}
-
-        for part in parts:
-            if part.startswith('txid:'):
-                tx_data['txid'] = part[5:]
-            elif part.startswith('vin:'):
-                vin_str = part[4:]
-                if vin_str and vin_str != 'coinbase':
-                    for vin_item in vin_str.split(','):
-                        if ':' in vin_item:
-                            prev_txid, vout_idx = vin_item.split(':', 1)
-                            tx_data['vin'].append({
-                                'txid': prev_txid,
-                                'vout': int(vout_idx)
-                            })
-            elif part.startswith('vout:'):
-                vout_str = part[5:]
-                if vout_str:
-                    for i, vout_item in enumerate(vout_str.split(',')):
-                        if ':' in vout_item:
-                            addr, amount = vout_item.split(':', 1)
-                            tx_data['vout'].append({
-                                'n': i,
-                                'address': addr,
-                                'value': float(amount)
-                            })
-
-        if 'txid' in tx_data:
-            self.process_transaction(tx_data)
+        match = TEXT_LINE_RE.match(line)
+        if match is None:
+            print(f"Warning: Skipping unrecognized line: {line}")
+            return
+
+        txid, vin_str, vout_str = match.groups()
+        tx_data = {'txid': txid, 'vin': [], 'vout': []}
+
+        # 'coinbase' has no ':' and therefore yields no items
+        if vin_str:
+            tx_data['vin'] = [
+                {'txid': m.group(1), 'vout': int(m.group(2))}
+                for m in TEXT_VIN_ITEM_RE.finditer(vin_str)
+            ]
+
+        if vout_str:
+            tx_data['vout'] = [
+                {'n': i, 'address': m.group(1), 'value': float(m.group(2))}
+                for i, m in enumerate(TEXT_VOUT_ITEM_RE.finditer(vout_str))
+            ]
+
+        self.process_transaction(tx_data)
 
     def process_transaction(self, tx_data: Dict):
         """Process a single transaction"""
         txid = tx_data.get('txid', '')
         if not txid:
             return
+        # Txids recur as dict keys and in edges; share one string per txid
+        txid = sys.intern(txid)
 
-        # Store transaction data
-        self.transactions[txid] = {
-            'vin': tx_data.get('vin', []),
-            'vout': tx_data.get('vout', []),
-            'tx_label': tx_data.get('tx_label'),
-            'size': tx_data.get('size'),
-            'fee': tx_data.get('fee'),
-        }
+        # Output ports are rendered once here rather than on every label generation
+        vout_ports = []
+        for i, vout in enumerate(tx_data.get('vout', [])):
+            converted_addr = self.convert_address(vout.get('address'))
+            value = '{:,}'.format(int(vout.get('value')))
+            vout_ports.append(f"<out{i}>#{i} {converted_addr}: {value}\\l")
+
+        # A txid listed more than once already has its edges
+        is_new = txid not in self.transactions
+
+        # Store only what the node label needs, not the raw vin/vout records
+        self.transactions[txid] = TxNode(
+            len(tx_data.get('vin', [])),
+            vout_ports,
+            tx_data.get('tx_label'),
+            tx_data.get('size'),
+            tx_data.get('fee'),
+        )
+
+        if not is_new:
+            return
 
         # Create edges from inputs to this transaction
-        for vin in tx_data.get('vin', []):
+        for input_idx, vin in enumerate(tx_data.get('vin', [])):
             if 'txid' in vin and vin['txid'] != 'coinbase':
-                prev_txid = vin['txid']
+                prev_txid = sys.intern(vin['txid'])
                 prev_vout = vin.get('vout', 0)
-                self.edges.append((prev_txid, prev_vout, txid))
+                self.edges.append((prev_txid, prev_vout, txid, input_idx))
 
     def generate_node_label(self, txid: str) -> str:
         """Generate node label in the specified format"""
-        tx = self.transactions.get(txid, {'vin': [], 'vout': []})
+        tx = self.transactions.get(txid, TxNode(0, [], '', None, None))
 
         # Generate input ports
         vin_parts = []
-        for i, vin in enumerate(tx['vin']):
+        for i in range(tx.vin_count):
             vin_parts.append(f"<in{i}>in#{i}")
 
-        # Generate output ports
-        vout_parts = []
-        for i, vout in enumerate(tx['vout']):
-            raw_addr = vout.get('address')
-            converted_addr = self.convert_address(raw_addr)
-            value = '{:,}'.format(int(vout.get('value')))
-            vout_parts.append(f"<out{i}>#{i} {converted_addr}: {value}\\l")
+        # Output ports are prepared by process_transaction
+        vout_parts = tx.vout_ports
 
         # Construct label
         vin_section = "|".join(vin_parts) if vin_parts else ""
         vout_section = "|".join(vout_parts) if vout_parts else ""
 
         # transaction label
-        if len(tx['tx_label']) != 0:
-            txid = f"{txid}\\n{tx['tx_label']} (size={'{:,}'.format(tx['size'])}, fee={'{:,}'.format(tx['fee'])})"
+        if tx.tx_label:
+            txid = f"{txid}\\n{tx.tx_label} (size={'{:,}'.format(tx.size)}, fee={'{:,}'.format(tx.fee)})"
 
         if vin_section and vout_section:
             label = f"{txid}|{{{{{vin_section}}}|{{{vout_section}}}}}"
@@ -156,51 +212,33 @@ class BitcoinFlowVisualizer:
 
         return label
 
-    def generate_dot(self) -> str:
-        """Generate DOT language output"""
-        dot_lines = [
-            "digraph bitcoin_flow {",
-            "    rankdir=LR;",
-            "    graph [fontname=\"monospace\"];",
-            "    node [shape=record, fontname=\"monospace\", fontsize=10];",
-            "    edge [fontname=\"Arial\", fontsize=8];",
-            ""
-        ]
+    def generate_dot(self, out: TextIO):
+        """Write DOT language output to a text stream"""
+        out.write(DOT_HEADER)
 
         # Add nodes
         for txid in self.transactions:
             label = self.generate_node_label(txid)
             # Escape special characters in DOT
             escaped_label = label   # .replace('"', '\\"').replace('|', '\\|').replace('{', '\\{').replace('}', '\\}').replace('<', '\\<').replace('>', '\\>')
-            dot_lines.append(f'    "{txid}" [label="{escaped_label}"];')
+            out.write(f'    "{txid}" [label="{escaped_label}"];\n')
 
-        dot_lines.append("")
+        out.write("\n")
 
         # Add edges
-        for prev_txid, prev_vout, curr_txid in self.edges:
-            if prev_txid in self.transactions and curr_txid in self.transactions:
-                # Find the input index in current transaction
-                curr_tx = self.transactions[curr_txid]
-                input_idx = 0
-                for i, vin in enumerate(curr_tx['vin']):
-                    if vin.get('txid') == prev_txid and vin.get('vout') == prev_vout:
-                        input_idx = i
-                        break
-
-                dot_lines.append(f'    "{prev_txid}":out{prev_vout} -> "{curr_txid}":in{input_idx};')
-
-        dot_lines.extend([
-            "",
-            "}"
-        ])
+        transactions = self.transactions
+        out.writelines(
+            f'    "{prev_txid}":out{prev_vout} -> "{curr_txid}":in{input_idx};\n'
+            for prev_txid, prev_vout, curr_txid, input_idx in self.edges
+            if prev_txid in transactions and curr_txid in transactions
+        )
 
-        return "\n".join(dot_lines)
+        out.write(DOT_FOOTER)
 
     def save_dot_file(self, output_filename: str):
         """Save DOT output to file"""
-        dot_content = self.generate_dot()
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            f.write(dot_content)
+        with open(output_filename, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            self.generate_dot(f)
         print(f"DOT file saved as: {output_filename}")
 
 def main():
@@ -6,36 +6,169 @@ Fetches Bitcoin transaction data from Esplora API and outputs in JSON Lines form
 
 import requests
 import json
+import logging
+import re
+import sqlite3
 import sys
+import threading
 import time
-from typing import Dict, List, Optional
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib3.util.retry import Retry
+
+try:
+    # Faster JSON parsing/serialization when available
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    json_loads = json.loads
+
+log = logging.getLogger(__name__)
 
 DEFAULT_BASE_URL = "http://localhost:3002"
+DEFAULT_WORKERS = 8
+# Minimum seconds between progress lines
+PROGRESS_INTERVAL = 0.5
+# Bytes of output collected before each write to the file
+WRITE_CHUNK_SIZE = 1 << 20
+# "<txid>[,<label>]" lines of the TXID list (a TXID is 64 hex characters), and any
+# line that is not blank or a comment; lines are joined by '\n' and may carry any
+# whitespace that str.strip() removes
+TXID_LINE_RE = re.compile(r'^[^\S\n]*([0-9a-fA-F]{64})(?:,([^\n]*?))?[^\S\n]*$', re.M)
+DATA_LINE_RE = re.compile(r'^[^\S\n]*[^#\s]', re.M)
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    Tokens refill at rate per second up to burst; acquire() takes one,
+    sleeping until it is available.
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # A negative balance reserves the next token for this caller
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
 class EsploraFetcher:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, max_workers: int = DEFAULT_WORKERS, cache_path: Optional[str] = None):
         self.base_url = base_url.rstrip('/')
+        self.max_workers = max(1, max_workers)
         self.session = requests.Session()
+        # Keep one pooled keep-alive connection per worker thread, and retry
+        # transient server errors and rate limiting (honoring Retry-After)
+        retries = Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 502, 503, 504])
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.max_workers, max_retries=retries
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         # Set reasonable timeouts
         self.session.timeout = 30
+        # Shared by all worker threads; set when a delay is configured
+        self.rate_limiter = None
+        # Optional on-disk transaction cache shared across runs: confirmed transactions
+        # are reused as-is, unconfirmed ones with an ETag are revalidated by If-None-Match
+        self._cache_db = None
+        self._cache_lock = threading.Lock()
+        if cache_path:
+            try:
+                self._cache_db = sqlite3.connect(cache_path, check_same_thread=False)
+                # json holds the raw response body bytes
+                self._cache_db.execute(
+                    "CREATE TABLE IF NOT EXISTS tx ("
+                    "txid TEXT PRIMARY KEY, json BLOB NOT NULL, etag TEXT, confirmed INTEGER NOT NULL)"
+                )
+            except sqlite3.Error as e:
+                log.warning("Warning: Transaction cache disabled: %s", e)
+                if self._cache_db is not None:
+                    self._cache_db.close()
+                self._cache_db = None
+
+    def _load_cached_transaction(self, txid: str) -> Optional[Tuple[Dict, Optional[str], bool]]:
+        """
+        Return (transaction data, ETag, confirmed) from the on-disk cache,
+        or None if not cached
+        """
+        if self._cache_db is None:
+            return None
+        # The cache is best-effort; any problem falls back to the network
+        try:
+            with self._cache_lock:
+                row = self._cache_db.execute(
+                    "SELECT json, etag, confirmed FROM tx WHERE txid = ?", (txid,)
+                ).fetchone()
+            if row is None:
+                return None
+            return json_loads(row[0]), row[1], bool(row[2])
+        except (sqlite3.Error, ValueError) as e:
+            log.warning("Warning: Ignoring cache entry for %s: %s", txid, e)
+            return None
+
+    def _store_cached_transaction(self, txid: str, tx_data: Dict, raw_json: bytes, etag: Optional[str]):
+        """
+        Save a transaction to the on-disk cache.
+        Unconfirmed transactions can still change, so they are only kept when
+        the server sent an ETag to revalidate them with.
+        """
+        confirmed = bool(tx_data.get('status', {}).get('confirmed'))
+        if self._cache_db is None or not (confirmed or etag):
+            return
+        try:
+            with self._cache_lock, self._cache_db:
+                self._cache_db.execute(
+                    "INSERT OR REPLACE INTO tx (txid, json, etag, confirmed) VALUES (?, ?, ?, ?)",
+                    (txid, raw_json, etag, confirmed)
+                )
+        except sqlite3.Error as e:
+            log.warning("Warning: Could not cache %s: %s", txid, e)
 
     def get_transaction(self, txid: str) -> Optional[Dict]:
         """
         Fetch transaction data from Esplora API
         Returns transaction data or None if failed
         """
+        # Confirmed transactions never change; others are revalidated by ETag
+        cached = self._load_cached_transaction(txid)
+        headers = None
+        if cached is not None:
+            tx_data, etag, confirmed = cached
+            if confirmed:
+                return tx_data
+            headers = {'If-None-Match': etag}
+
         url = f"{self.base_url}/tx/{txid}"
 
         try:
-            print(f"Fetching: {txid}")
-            response = self.session.get(url)
+            log.debug("Fetching: %s", txid)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            response = self.session.get(url, headers=headers)
+            if response.status_code == 304 and cached is not None:
+                return tx_data
             response.raise_for_status()
-            return response.json()
+            tx_data = json_loads(response.content)
+            self._store_cached_transaction(txid, tx_data, response.content, response.headers.get('ETag'))
+            return tx_data
 
         except requests.exceptions.RequestException as e:
-            print(f"Error fetching {txid}: {e}")
+            log.error("Error fetching %s: %s", txid, e)
             return None
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON for {txid}: {e}")
+        except ValueError as e:
+            log.error("Error parsing JSON for %s: %s", txid, e)
             return None
 
     def process_transaction(self, tx_data: Dict, tx_label: str) -> Dict:
@@ -44,51 +177,32 @@ class EsploraFetcher:
         """
         txid = tx_data.get('txid', '')
 
-        # Process inputs (vin)
-        vin = []
-        for input_data in tx_data.get('vin', []):
-            try:
-                if 'txid' in input_data and input_data['txid']:
-                    # Regular input
-                    vin.append({
-                        'txid': input_data['txid'],
-                        'vout': input_data.get('vout', 0)
-                    })
-                else:
-                    # Coinbase input or missing txid
-                    vin.append({
-                        'txid': 'coinbase',
-                        'vout': 0
-                    })
-            except Exception as e:
-                print(f"Warning: Error processing vin for {txid}: {e}")
-                # Add a fallback coinbase entry
-                vin.append({
-                    'txid': 'coinbase',
-                    'vout': 0
-                })
-
-        # Process outputs (vout)
-        vout = []
-        for i, output_data in enumerate(tx_data.get('vout', [])):
-            try:
-                address = output_data.get('scriptpubkey_address', f"output_{i}")
-                vout_entry = {
+        # Process inputs (vin); coinbase inputs or missing txids become 'coinbase'
+        vin_data = tx_data.get('vin', [])
+        try:
+            vin = [
+                {'txid': input_data['txid'], 'vout': input_data.get('vout', 0)}
+                if input_data.get('txid') else
+                {'txid': 'coinbase', 'vout': 0}
+                for input_data in vin_data
+            ]
+        except Exception:
+            vin = self._process_vin_entries(vin_data, txid)
+
+        # Process outputs (vout) keeping the raw address
+        vout_data = tx_data.get('vout', [])
+        try:
+            vout = [
+                {
                     'n': i,
                     'value': output_data.get('value', 0),
-                    'address': address # Use raw address
+                    'address': output_data['scriptpubkey_address']
+                    if 'scriptpubkey_address' in output_data else f"output_{i}"
                 }
-
-                vout.append(vout_entry)
-
-            except Exception as e:
-                print(f"Warning: Error processing vout {i} for {txid}: {e}")
-                # Add a fallback entry
-                vout.append({
-                    'n': i,
-                    'value': 0.0,
-                    'address': f"error_output_{i}"
-                })
+                for i, output_data in enumerate(vout_data)
+            ]
+        except Exception:
+            vout = self._process_vout_entries(vout_data, txid)
 
         return {
             'txid': txid,
@@ -99,6 +213,48 @@ class EsploraFetcher:
             'vout': vout
         }
 
+    def _process_vin_entries(self, vin_data: List, txid: str) -> List[Dict]:
+        """
+        Process vin one entry at a time, replacing malformed entries with coinbase
+        """
+        vin = []
+        for input_data in vin_data:
+            try:
+                if input_data.get('txid'):
+                    vin.append({'txid': input_data['txid'], 'vout': input_data.get('vout', 0)})
+                else:
+                    vin.append({'txid': 'coinbase', 'vout': 0})
+            except Exception as e:
+                log.warning("Warning: Error processing vin for %s: %s", txid, e)
+                vin.append({'txid': 'coinbase', 'vout': 0})
+        return vin
+
+    def _process_vout_entries(self, vout_data: List, txid: str) -> List[Dict]:
+        """
+        Process vout one entry at a time, replacing malformed entries with placeholders
+        """
+        vout = []
+        for i, output_data in enumerate(vout_data):
+            try:
+                vout.append({
+                    'n': i,
+                    'value': output_data.get('value', 0),
+                    'address': output_data.get('scriptpubkey_address', f"output_{i}")
+                })
+            except Exception as e:
+                log.warning("Warning: Error processing vout %d for %s: %s", i, txid, e)
+                vout.append({'n': i, 'value': 0.0, 'address': f"error_output_{i}"})
+        return vout
+
+    def _fetch_and_process(self, txid: str, tx_label: str) -> Optional[Dict]:
+        """
+        Fetch and process one transaction; runs in a worker thread
+        """
+        tx_data = self.get_transaction(txid)
+        if not tx_data:
+            return None
+        return self.process_transaction(tx_data, tx_label)
+
     def read_txid_list(self, filename: str) -> List[str]:
         """
         Read TXID list from file
@@ -107,19 +263,18 @@ class EsploraFetcher:
         txids = []
         try:
             with open(filename, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        # Remove any extra whitespace and validate format
-                        l = line.split(',')
-                        label = ''
-                        if len(l) == 2:
-                            label = l[1]
-                        txid = l[0]  # Take first word if multiple
-                        if len(txid) == 64:  # Bitcoin TXID is 64 hex characters
-                            txids.append({'txid': txid, 'label': label})
-                        else:
-                            print(f"Warning: Invalid TXID format: {txid}")
+                # Accept every line ending str.splitlines() knows, as '\n' only
+                lines = f.read().splitlines()
+            data = '\n'.join(lines)
+
+            for match in TXID_LINE_RE.finditer(data):
+                txids.append({'txid': match.group(1), 'label': match.group(2) or ''})
+
+            # Only files with invalid lines pay for a per-line pass to report them
+            if len(txids) != len(DATA_LINE_RE.findall(data)):
+                for line in lines:
+                    if DATA_LINE_RE.match(line) and not TXID_LINE_RE.match(line):
+                        log.warning("Warning: Invalid TXID format: %s", line.strip().partition(',')[0])
 
             print(f"Found {len(txids)} valid TXIDs in {filename}")
             return txids
@@ -128,74 +283,117 @@ class EsploraFetcher:
             print(f"Error: File '{filename}' not found.")
             sys.exit(1)
 
-    def fetch_all_transactions(self, txids: List[str], delay: float = 0.1) -> List[Dict]:
+    def iter_transactions(self, txids: List[Dict], delay: float = 0.0) -> Iterator[Dict]:
         """
-        Fetch all transactions with optional delay between requests
+        Fetch transactions concurrently and yield them processed, in input order.
+        If delay is set, requests start at least delay seconds apart.
         """
-        transactions = []
-        total = len(txids)
-
-        for i, txid in enumerate(txids):
-            print(f"Progress: {i+1}/{total}")
-
-            tx_data = self.get_transaction(txid.get('txid'))
-            if tx_data:
-                processed_tx = self.process_transaction(tx_data, txid.get('label', ''))
-                transactions.append(processed_tx)
-
-            # Add delay to avoid overwhelming the API
-            if delay > 0 and i < total - 1:
-                time.sleep(delay)
-
-        print(f"Successfully fetched {len(transactions)} transactions")
-        return transactions
-
-    def save_json_lines(self, transactions: List[Dict], output_file: str):
+        self.rate_limiter = TokenBucket(1 / delay) if delay > 0 else None
+
+        # Fetch each distinct txid only once, even if it is listed repeatedly.
+        # Workers also process the fetched data while other requests are in flight.
+        first_labels = {}
+        remaining = Counter()
+        for txid in txids:
+            first_labels.setdefault(txid.get('txid'), txid.get('label', ''))
+            remaining[txid.get('txid')] += 1
+        total = len(first_labels)
+        fetched_count = 0
+        last_report = 0.0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Results arrive in first-occurrence order, matching the walk below.
+            # Only a bounded window of fetches runs ahead of the consumer, so
+            # finished transactions do not pile up when it is slower.
+            pending = iter(first_labels.items())
+            in_flight = deque(
+                executor.submit(self._fetch_and_process, next_txid, next_label)
+                for next_txid, next_label in islice(pending, 2 * self.max_workers)
+            )
+            # Only txids that are listed again later are kept around
+            results = {}
+            for txid in txids:
+                key = txid.get('txid')
+                if key not in results:
+                    results[key] = in_flight.popleft().result()
+                    for next_txid, next_label in islice(pending, 1):
+                        in_flight.append(executor.submit(self._fetch_and_process, next_txid, next_label))
+                    fetched_count += 1
+
+                    # Report progress at most every PROGRESS_INTERVAL seconds
+                    now = time.monotonic()
+                    if fetched_count == total or now - last_report >= PROGRESS_INTERVAL:
+                        print(f"Progress: {fetched_count}/{total}")
+                        last_report = now
+
+                processed_tx = results[key]
+                remaining[key] -= 1
+                if remaining[key] == 0:
+                    del results[key]
+
+                if processed_tx:
+                    label = txid.get('label', '')
+                    if processed_tx['tx_label'] != label:
+                        # Repeated txid with its own label
+                        processed_tx = dict(processed_tx, tx_label=label)
+                    yield processed_tx
+
+    def save_json_lines(self, transactions: Iterable[Dict], output_file: str) -> int:
         """
-        Save transactions in JSON Lines format
+        Save transactions in JSON Lines format as they arrive
+        Returns the number of transactions written
         """
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
+            count = 0
+            with open(output_file, 'wb') as f:
+                buf = bytearray()
                 for tx in transactions:
-                    json.dump(tx, f, separators=(',', ':'))
-                    f.write('\n')
+                    count += 1
+                    buf += json_dumps(tx)
+                    buf += b'\n'
+                    if len(buf) >= WRITE_CHUNK_SIZE:
+                        f.write(buf)
+                        buf.clear()
+                f.write(buf)
 
             print(f"Transactions saved to: {output_file}")
+            return count
 
-        except Exception as e:
+        except OSError as e:
+            # Only file errors; failures while producing transactions keep their own message
             print(f"Error saving file: {e}")
             sys.exit(1)
 
-    def save_text_format(self, transactions: List[Dict], output_file: str):
+    def save_text_format(self, transactions: Iterable[Dict], output_file: str) -> int:
         """
-        Save transactions in simple text format
+        Save transactions in simple text format as they arrive
+        Returns the number of transactions written
         """
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
+            # A large buffer turns the per-transaction writes into few syscalls
+            count = 0
+            with open(output_file, 'w', encoding='utf-8', buffering=WRITE_CHUNK_SIZE) as f:
                 for tx in transactions:
-                    txid = tx['txid']
-
+                    count += 1
                     # Format vin
-                    vin_parts = []
-                    for vin in tx['vin']:
-                        if vin['txid'] == 'coinbase':
-                            vin_parts.append('coinbase')
-                        else:
-                            vin_parts.append(f"{vin['txid']}:{vin['vout']}")
-                    vin_str = ','.join(vin_parts) if vin_parts else 'coinbase'
+                    vin_str = ','.join([
+                        'coinbase' if vin['txid'] == 'coinbase' else f"{vin['txid']}:{vin['vout']}"
+                        for vin in tx['vin']
+                    ]) or 'coinbase'
 
                     # Format vout
-                    vout_parts = []
-                    for vout in tx['vout']:
-                        addr = vout.get('address', 'unknown')
-                        vout_parts.append(f"{addr}:{vout['value']}")
-                    vout_str = ','.join(vout_parts)
+                    vout_str = ','.join([
+                        f"{vout.get('address', 'unknown')}:{vout['value']}"
+                        for vout in tx['vout']
+                    ])
 
-                    f.write(f"txid:{txid} vin:{vin_str} vout:{vout_str}\n")
+                    f.write(f"txid:{tx['txid']} vin:{vin_str} vout:{vout_str}\n")
 
             print(f"Transactions saved to: {output_file}")
+            return count
 
-        except Exception as e:
+        except OSError as e:
+            # Only file errors; failures while producing transactions keep their own message
             print(f"Error saving file: {e}")
             sys.exit(1)
 
@@ -205,13 +403,18 @@ def main():
         print("")
         print("Options:")
         print("  --base-url URL    Esplora API base URL (default: {})".format(DEFAULT_BASE_URL))
-        print("  --delay SECONDS   Delay between API requests (default: 0.1)")
+        print("  --delay SECONDS   Minimum interval between API requests (default: 0)")
         print("  --format FORMAT   Output format: json|text (default: json)")
+        print("  --workers N       Number of concurrent API requests (default: {})".format(DEFAULT_WORKERS))
+        print("  --cache FILE      SQLite cache file reused across runs (confirmed transactions,")
+        print("                    plus unconfirmed ones revalidated by ETag)")
+        print("  --verbose         Log every API request")
         print("")
         print("Examples:")
         print("  python esplora_fetcher.py txids.txt transactions.json")
         print("  python esplora_fetcher.py txids.txt transactions.txt --format text")
         print("  python esplora_fetcher.py txids.txt data.json --base-url http://localhost:8094/regtest/api --delay 0.2")
+        print("  python esplora_fetcher.py txids.txt transactions.json --cache txcache.db")
         sys.exit(1)
 
     txid_file = sys.argv[1]
@@ -219,8 +422,11 @@ def main():
 
     # Parse options
     base_url = DEFAULT_BASE_URL
-    delay = 0.1
+    delay = 0.0
     output_format = "json"
+    workers = DEFAULT_WORKERS
+    cache_path = None
+    log_level = logging.INFO
 
     i = 3
     while i < len(sys.argv):
@@ -240,15 +446,37 @@ def main():
                 print("Error: Format must be 'json' or 'text'")
                 sys.exit(1)
             i += 2
+        elif sys.argv[i] == "--workers" and i + 1 < len(sys.argv):
+            try:
+                workers = int(sys.argv[i + 1])
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                print("Error: Invalid workers value")
+                sys.exit(1)
+            i += 2
+        elif sys.argv[i] == "--cache" and i + 1 < len(sys.argv):
+            cache_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--verbose":
+            log_level = logging.DEBUG
+            i += 1
         else:
             print(f"Error: Unknown option {sys.argv[i]}")
             sys.exit(1)
 
+    logging.basicConfig(level=log_level, format="%(message)s")
+    # Keep urllib3's own connection/retry messages out of the output
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+
     # Initialize fetcher
-    fetcher = EsploraFetcher(base_url)
+    fetcher = EsploraFetcher(base_url, workers, cache_path)
 
     print(f"Using Esplora API: {base_url}")
     print(f"Request delay: {delay} seconds")
+    print(f"Concurrent requests: {workers}")
+    if cache_path:
+        print(f"Transaction cache: {cache_path}")
     print(f"Output format: {output_format}")
     print("")
 
@@ -258,18 +486,22 @@ def main():
         print("No valid TXIDs found in input file")
         sys.exit(1)
 
-    # Fetch transactions
-    transactions = fetcher.fetch_all_transactions(txids, delay)
+    # Fetch transactions, streaming them into the output file as they arrive
+    transactions = fetcher.iter_transactions(txids, delay)
 
-    if not transactions:
+    # Do not create the output file unless at least one transaction was fetched
+    first_tx = next(transactions, None)
+    if first_tx is None:
         print("No transactions were successfully fetched")
         sys.exit(1)
+    transactions = chain([first_tx], transactions)
 
     # Save results
     if output_format == "json":
-        fetcher.save_json_lines(transactions, output_file)
+        count = fetcher.save_json_lines(transactions, output_file)
     else:
-        fetcher.save_text_format(transactions, output_file)
+        count = fetcher.save_text_format(transactions, output_file)
+    print(f"Successfully fetched {count} transactions")
 
     print(f"\nReady to visualize with:")
     print(f"python bitcoin_flow_dot.py {output_file}")